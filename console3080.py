@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"console3080.py - Console keyboard input for the Digiac-3080 emulator"
+
+#   Copyright (C) 2020 Robert N. Evans
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from codecs import getincrementaldecoder
+from collections import deque
+import os
+import sys
+
+try:
+    import termios
+except ImportError:  # not a POSIX system, fall back to readchar
+    termios = None
+    try:
+        from readchar import readchar
+    except ImportError:
+        exit('You must install the PyPI package "readchar" to use this package.')
+
+
+class Console:
+    "Keyboard of the console teleprinter, with type-ahead"
+
+    def __init__(self, fd=None):
+        "fd is the terminal file descriptor, default standard input"
+        self.fd = fd
+        self._tty = None  # file descriptor of the terminal while it is open
+        self._queue = deque()  # characters typed ahead
+        self._decoder = getincrementaldecoder("utf-8")("replace")
+        self._saved = None  # terminal attributes to restore
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pending(self):
+        "number of characters already typed ahead"
+        return len(self._queue)
+
+    def _terminal(self):
+        "file descriptor of the keyboard terminal, or None if input is not a terminal"
+        fd = self.fd
+        if fd is None:
+            try:
+                fd = sys.stdin.fileno()
+            except (AttributeError, ValueError, OSError):  # e.g. replaced by StringIO
+                return None
+        return fd if os.isatty(fd) else None
+
+    def open(self):
+        "stop the terminal from echoing and line buffering until close()"
+        if termios is None or self._saved is not None:
+            return
+        fd = self._terminal()
+        if fd is None:
+            return
+        self._tty = fd
+        self._saved = termios.tcgetattr(fd)
+        mode = termios.tcgetattr(fd)
+        mode[0] &= ~termios.ICRNL  # iflags; Return reads as "\r" like readchar
+        mode[3] &= ~(termios.ICANON | termios.ECHO)  # lflags; keep ISIG for Control-C
+        mode[6][termios.VMIN] = 1
+        mode[6][termios.VTIME] = 0
+        termios.tcsetattr(fd, termios.TCSANOW, mode)
+
+    def close(self):
+        "restore the terminal, keeping any characters typed ahead"
+        if self._saved is not None:
+            termios.tcsetattr(self._tty, termios.TCSADRAIN, self._saved)
+            self._saved = None
+            self._tty = None
+
+    def read_char(self):
+        "Return the next typed character, waiting for one if needed"
+        while not self._queue:
+            if termios is None:
+                return readchar()
+            if self._saved is None and self._terminal() is None:
+                c = sys.stdin.read(1)  # piped or replaced standard input
+                if not c:
+                    raise EOFError("Type In data exhausted")
+                return c
+            opened = self._saved is None
+            if opened:
+                self.open()  # read outside of a run, e.g. from the API
+            try:
+                # returns everything typed so far, waiting only for the first byte
+                data = os.read(self._tty, 1024)
+            finally:
+                if opened:
+                    self.close()
+            if not data:
+                raise EOFError("Type In data exhausted")
+            self._queue.extend(self._decoder.decode(data))
+        return self._queue.popleft()
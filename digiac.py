@@ -18,12 +18,8 @@
 
 from array import array
 from random import seed, randrange
-from time import sleep
-
-try:
-    from readchar import readchar
-except ImportError:
-    exit('You must install the PyPI package "readchar" to use this package.')
+from time import perf_counter, sleep
+from console3080 import Console
 
 
 def _ta_char(c):
@@ -35,6 +31,42 @@ def _ta_char(c):
     )[c]
 
 
+# Reasons recorded in Digiac3080.stop_reason when the CPU stops running
+STOP_REASONS = (
+    "halt",  # HLT instruction
+    "invalid",  # invalid or unknown opcode
+    "divide",  # divide by zero stop
+    "breakpoint",  # execution breakpoint
+    "acstop",  # address compare stop
+    "tape",  # no tape or bad tape character in PTReader
+    "input",  # Type In data file exhausted
+    "step",  # requested number of instructions executed
+    "budget",  # instruction budget exhausted
+    "interrupt",  # Control-C
+)
+
+# Estimated execution time of each opcode in machine cycles.  An ordinary
+# instruction takes one 64 cycle word time; MLT and DIV iterate serially.
+# TA and RT also take TA_CHAR_CYCLES per character printed and RT_FRAME_CYCLES
+# per tape frame read.  Invalid opcodes cost one word time.
+# fmt: off
+CYCLE_COSTS = (
+    #  0    1    2    3    4    5    6    7
+      64,  64,  64,  64,  64,  64,  64,  64,   # 00 HLT, AND
+      64,  64,  64,  64,  64,  64,  64,  64,   # 10 CLA/CLS, ADD/SUB
+     512, 512, 512, 512, 640, 640, 640, 640,   # 20 MLT, DIV
+      64,  64,  64,  64,  64,  64,  64,  64,   # 30 STA, STB
+      64,  64,  64,  64,  64,  64,  64,  64,   # 40 JMP, branches
+      64,  64,  64,  64,  64,  64,  64,  64,   # 50 TO, TA
+      64,  64,  64,  64,  64,  64,  64,  64,   # 60 RT, RC, TI, PT
+      64,  64,  64,  64,  64,  64,  64,  64,   # 70
+)
+# fmt: on
+TA_CHAR_CYCLES = 400  # 10 characters per second teleprinter
+RT_FRAME_CYCLES = 13  # 300 frames per second tape reader
+CYCLE_TIME = 250e-6  # seconds per machine cycle
+
+
 class Digiac3080:
     "Emulate the Digiac-3080 computer system"
 
@@ -52,11 +84,21 @@ class Digiac3080:
         self.b = (0, 0)
         self.instruction_count = 0
         self.ips = 60  # instructions per second
+        self.cycles = 0  # emulated machine cycles executed
+        self.cycle_costs = list(CYCLE_COSTS)  # machine cycles for each opcode
+        self.ta_char_cycles = TA_CHAR_CYCLES  # machine cycles per character typed by TA
+        self.rt_frame_cycles = RT_FRAME_CYCLES  # machine cycles per tape frame read by RT
+        self.cycle_time = CYCLE_TIME  # seconds per machine cycle
+        self.pace = False  # pace wall-clock time to emulated time instead of ips
+        self._pace_origin = 0.0  # wall-clock time when emulated time was zero
         self.ptp = None  # file handle for tape reader
         self.ptr = None  # file handle for tape punch
+        self.ti = None  # file handle for Type In data (None = console)
+        self.console = Console()  # console teleprinter keyboard
         self.bpt = []  # execution breakpoints
         self.acs = []  # address compare stop addresses
         self.run = True  # advise to caller: whether CPU should run or stop
+        self.stop_reason = None  # why the CPU last stopped, see STOP_REASONS
         self._opcode = 0
         self._count = 0
         self._addr = 0
@@ -83,6 +125,7 @@ class Digiac3080:
         s = (
             f"Digiac< PC: {self.pc:04o}->{instr:08o} {self.areg_str} "
             + f"{self.breg_str} Icnt: {self.instruction_count} IPS: {self.ips}"
+            + f" Time: {self.elapsed:.3f}s"
         )
         if self.bpt:
             s += " bpt"
@@ -94,18 +137,44 @@ class Digiac3080:
                 s += f":{b:04o}"
         return s + ">"
 
+    @property
+    def elapsed(self):
+        "emulated time in seconds"
+        return self.cycles * self.cycle_time
+
+    def _pace(self):
+        "sleep until wall-clock time catches up with emulated time"
+        ahead = self.elapsed - (perf_counter() - self._pace_origin)
+        if ahead > 0:
+            sleep(ahead)
+        elif ahead < -0.1:  # resynchronize after waiting for input or the user
+            self._pace_origin = perf_counter() - self.elapsed
+
+    def _wait(self):
+        "hold execution to emulated time or to the throttled instruction rate"
+        if self.pace:  # match emulated time
+            self._pace()
+        elif self.ips:  # throttle to realistic speed
+            sleep(1 / self.ips)
+
+    def stop(self, reason):
+        "stop the CPU and record the reason"
+        assert reason in STOP_REASONS, reason
+        self.run = False
+        self.stop_reason = reason
+
     def rm(self, addr):
         "read a word from the memory array of 32-bit words"
         if addr in self.acs:
             print(f"Read Memory address Compare Stop @ {addr:04o}")
-            self.run = False
+            self.stop("acstop")
         return self.mem[addr]
 
     def wm(self, addr, val):
         "write to memory array of 32-bit words"
         if addr in self.acs:
             print(f"Write Memory address Compare Stop @ {addr:04o}")
-            self.run = False
+            self.stop("acstop")
         self.mem[addr] = val
 
     def _shift(self, val):
@@ -146,11 +215,11 @@ class Digiac3080:
         # NOTE: Breakpoints stop the CPU before instruction executes
         pc = self.pc
         if pc in self.bpt:
-            self.run = False
+            self.stop("breakpoint")
             return f"Breakpoint at {pc:04o}"
 
-        if self.ips:  # throttle to realistic speed
-            sleep(1 / self.ips)
+        if self.pace or self.ips:
+            self._wait()
         instr = self.rm(pc)  # fetch instruction
         self.pc = (self.pc + 1) % 4096  # increment PC
         self.instruction_count += 1
@@ -161,10 +230,11 @@ class Digiac3080:
         self._addr = (instr) & 0o7777
 
         # Execute / emulate known opcodes
+        self.cycles += self.cycle_costs[self._opcode]
         try:
             impl = self._implemented_instructions[self._opcode]
         except KeyError:
-            self.run = False
+            self.stop("invalid")
             rc = f"Invalid or Unknown OPCODE {instr:08o} at {pc:04o}"
         else:
             rc = impl(self)
@@ -172,7 +242,7 @@ class Digiac3080:
 
     def _inst_hlt(self):
         "HLT"
-        self.run = False
+        self.stop("halt")
         return f"HALTED at {self.pc:04o}"
 
     def _inst_and(self):
@@ -225,7 +295,7 @@ class Digiac3080:
         except ZeroDivisionError:
             # FIXME I think 3080 did not halt.
             rc = f"Divide by Zero Stop"
-            self.run = False
+            self.stop("divide")
         else:
             a, b = remd, quot
             self.a = (sgn, a)
@@ -272,6 +342,7 @@ class Digiac3080:
             wd <<= 6
             if c != 0o66:  # 'BLANK' does not print anything
                 buf += _ta_char(c)
+        self.cycles += len(buf) * self.ta_char_cycles
         print(buf, end="", flush=True)
         return f"next addr:     {self._addr:04o}"
 
@@ -286,6 +357,7 @@ class Digiac3080:
                 self.ptr.close()
                 self.ptr = None
                 raise EOFError(f"Reading PT beyond EOF")
+            self.cycles += self.rt_frame_cycles
             c = c[0]
             if c > 64:
                 msg = f"Unexpected PT character = 0x{c:02X} at offset {self.ptr.tell()}"
@@ -312,11 +384,11 @@ class Digiac3080:
                     break  # stop reading @ EOT
                 except RuntimeError as e:
                     print(e)
-                    self.run = False
+                    self.stop("tape")
                     break  # stop reading @ invalid character
             rc = f"next addr:     {self._addr:04o}"
         else:
-            self.run = False
+            self.stop("tape")
             rc = f"No Tape in PTReader"
         return rc
 
@@ -337,23 +409,39 @@ class Digiac3080:
     def _ti_char(self):
         "Read one typed in character and return the matching digiac character code"
         while True:
-            c = readchar().upper()
+            if self.ti:
+                c = self.ti.read(1).upper()
+                if not c:
+                    raise EOFError("Type In data exhausted")
+                if c in "\r\n":
+                    continue  # line breaks in the data file are not typed
+                more = True
+            else:
+                c = self.console.read_char().upper()
+                more = self.console.pending  # flush echo only before waiting for keys
             if ord(c) == 3:
                 raise KeyboardInterrupt()  # Control-C
             if c in self._tichars:
-                print(c, sep="", end="", flush=True)  # echo the typed character
+                print(c, sep="", end="", flush=not more)  # echo the typed character
                 return self._tichars[c]
-            print("\a", sep="", end="", flush=True)  # ring bell for invalid character
+            if not self.ti:
+                print("\a", sep="", end="", flush=not more)  # ring bell for invalid character
 
     def _inst_ti(self):
         "TI - Type In"
         wd = 0
         for idx in range((0o100 - self._count) * 4):
-            wd = wd << 6 | self._ti_char()
+            try:
+                wd = wd << 6 | self._ti_char()
+            except EOFError as e:
+                print(end="", flush=True)  # show the echo still buffered
+                self.stop("input")
+                return str(e)
             if idx % 4 == 3:
                 self.wm(self._addr, wd)
                 self._addr = self._addr + 1 & 0o7777
                 wd = 0
+        print(end="", flush=True)  # show the echo still buffered
         return f"next addr:     {self._addr:04o}"
 
     _implemented_instructions = {
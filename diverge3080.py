@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+"diverge3080.py - Find the first instruction where two Digiac-3080 runs differ"
+
+#   Copyright (C) 2020 Robert N. Evans
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from argparse import ArgumentParser
+from array import array
+from contextlib import redirect_stdout
+from io import StringIO
+from multiprocessing import Pool, cpu_count
+from os import devnull
+from random import Random
+import sys
+from digiac import Digiac3080
+from trace3080 import MNEMONICS
+import sim3080
+
+# Simulator commands that run instructions; the others set up the machine
+_RUN_COMMANDS = ("g", "go", "s", "step")
+# THROTTLE and CLOCK PACE would sleep, the runs are compared at full speed
+_IGNORED_COMMANDS = ("q", "quit", "eof", "pdb", "record", "hostprof", "trace", "throttle", "clock")
+_BLOCK_READS = (0o60, 0o63)  # RT and TI write a block of memory words
+
+
+def _run_args(cmd, arg):
+    "Return (start address or None, instruction count or None) of a GO or STEP command"
+    args = arg.split()
+    if cmd in ("g", "go"):
+        if not args:
+            return None, None
+        try:
+            addr = int(args[0], 8)
+            assert 0 <= addr <= 0o7777
+        except (ValueError, AssertionError):
+            raise ValueError(f'Invalid address: "{args[0]}"')
+        return addr, None
+    if not args:
+        return None, 1
+    try:
+        steps = int(args[0])
+        assert steps > 0
+    except (ValueError, AssertionError):
+        raise ValueError(f'Invalid number of instructions: "{args[0]}"')
+    return None, steps
+
+
+def check_script(lines):
+    "Raise ValueError for a GO or STEP command that the simulator would reject"
+    shell = sim3080.SimShell()
+    for num, line in enumerate(lines, 1):
+        cmd, _, arg = shell.precmd(line.strip()).partition(" ")
+        if cmd in _RUN_COMMANDS:
+            try:
+                _run_args(cmd, arg)
+            except ValueError as e:
+                raise ValueError(f"line {num}: {e}")
+
+
+class NoConsole:
+    "Console without a keyboard: Type In must read data attached with ATTACH TI"
+
+    pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def close(self):
+        pass
+
+    def read_char(self):
+        raise EOFError("No Type In data attached")
+
+
+class Run:
+    "A machine running a sim3080.py command script, one instruction at a time"
+
+    def __init__(self, lines, image, name=None):
+        "lines of simulator commands, image is the initial memory"
+        self.lines = []
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                self.lines.append(line)
+        self.d = d = Digiac3080()
+        d.mem = array("L", image)
+        d.ips = 0
+        d.console = NoConsole()
+        self.shell = sim3080.SimShell(d)
+        self.name = name  # shown with setup command output on stderr, None discards it
+        self.line = 0  # next script line
+        self.running = False  # inside a GO or STEP command
+        self.left = None  # instructions left for a STEP command
+        self.held_bpt = False  # ignore a breakpoint at the PC where a run starts
+        self.last = None  # (pc, instruction, result) of the last instruction
+        self.digest = 0  # hash chained over the state after each instruction
+
+    @property
+    def count(self):
+        "instructions executed so far"
+        return self.d.instruction_count
+
+    @property
+    def done(self):
+        "whether the script has finished"
+        return not self.running and self.line >= len(self.lines)
+
+    def _command(self, line):
+        "start a run command or perform a setup command"
+        line = self.shell.precmd(line)
+        cmd, _, arg = line.partition(" ")
+        if cmd in _IGNORED_COMMANDS:
+            return
+        if cmd not in _RUN_COMMANDS:
+            out = StringIO()
+            with redirect_stdout(out):
+                self.shell.onecmd(line)
+            if self.name:  # e.g. a tape that could not be attached
+                for text in out.getvalue().splitlines():
+                    print(f"{self.name}: {text}", file=sys.stderr)
+            return
+        addr, self.left = _run_args(cmd, arg)
+        if addr is not None:
+            self.d.pc = addr
+        self.running = True
+        self.held_bpt = True
+
+    def advance(self, n):
+        "execute up to n more instructions, return how many were executed"
+        d = self.d
+        start = d.instruction_count
+        while d.instruction_count - start < n:
+            if not self.running:
+                if self.line >= len(self.lines):
+                    break
+                self.line += 1
+                self._command(self.lines[self.line - 1])
+                continue
+            pc = d.pc
+            inst = d.mem[pc]
+            held = self.held_bpt and pc in d.bpt
+            if held:
+                d.bpt.remove(pc)
+            icount = d.instruction_count
+            d.run = True
+            try:
+                result = d.exec()
+            except Exception as e:  # a broken run is a difference too
+                d.run = False
+                result = f"{type(e).__name__}: {e}"
+            if held:
+                d.bpt.append(pc)
+            self.held_bpt = False
+            if d.instruction_count != icount:
+                self.last = (pc, inst, result)
+                # catch differences that vanish before the next checkpoint
+                addr = inst & 0o7777
+                if inst >> 18 & 0o77 in _BLOCK_READS:  # every word read, up to the next addr
+                    end = addr + (d._addr - addr & 0o7777)
+                    words = tuple(d.mem[a & 0o7777] for a in range(addr, end))
+                else:
+                    words = d.mem[addr], d.mem[d._addr - 1 & 0o7777]
+                self.digest = hash((self.digest, d.pc, d.a, d.b, words))
+            if self.left is not None:
+                self.left -= 1
+                if not self.left:
+                    self.running = False
+            if not d.run:
+                self.running = False
+        return d.instruction_count - start
+
+    def state(self):
+        "machine state compared between runs"
+        d = self.d
+        return d.instruction_count, d.pc, d.a, d.b, d.mem, self.done, self.digest
+
+    def snapshot(self):
+        "a checkpoint from which the run can be restored"
+        d = self.d
+        files = {}
+        for dev in ("ptr", "ti"):
+            f = getattr(d, dev)
+            files[dev] = (f.name, f.tell()) if f else None
+        return {
+            "mem": array("L", d.mem),
+            "regs": (d.pc, d.a, d.b, d.instruction_count, d.cycles),
+            "stops": (list(d.bpt), list(d.acs)),
+            "files": files,
+            "script": (self.lines, self.line, self.running, self.left, self.held_bpt),
+            "last": self.last,
+            "digest": self.digest,
+        }
+
+    @classmethod
+    def restore(cls, snap):
+        "recreate a run from a snapshot"
+        run = cls([], snap["mem"])
+        d = run.d
+        d.pc, d.a, d.b, d.instruction_count, d.cycles = snap["regs"]
+        d.bpt, d.acs = (list(x) for x in snap["stops"])
+        for dev, mode in (("ptr", "rb"), ("ti", "r")):
+            if snap["files"][dev]:
+                name, pos = snap["files"][dev]
+                f = open(name, mode, encoding=None if "b" in mode else "utf-8")
+                f.seek(pos)
+                setattr(d, dev, f)
+        run.lines, run.line, run.running, run.left, run.held_bpt = snap["script"]
+        run.last = snap["last"]
+        run.digest = snap["digest"]
+        return run
+
+
+def _quiet():
+    "worker process initializer, program output is not interesting"
+    sys.stdout = open(devnull, "w")
+
+
+def _probe(job):
+    "replay both runs from snapshots to instruction target, return (differ, snapshots)"
+    snap_a, snap_b, target = job
+    a, b = Run.restore(snap_a), Run.restore(snap_b)
+    a.advance(target - a.count)
+    b.advance(target - b.count)
+    return a.state() != b.state(), a.snapshot(), b.snapshot()
+
+
+def find_divergence(lines_a, lines_b, image, checkpoint, limit, pool, probes, names=(None, None)):
+    "Return snapshots just before and after the first difference, or None"
+    a, b = Run(lines_a, image, names[0]), Run(lines_b, image, names[1])
+    before = (a.snapshot(), b.snapshot())
+    # run both forward, keeping the last checkpoint where they agree
+    while True:
+        step = min(checkpoint, limit - a.count)
+        if step <= 0:
+            return None
+        a.advance(step)
+        b.advance(step)
+        if a.state() != b.state():
+            break
+        if a.done and b.done:
+            return None
+        before = (a.snapshot(), b.snapshot())
+    after = (a.snapshot(), b.snapshot())
+    # narrow the interval by replaying to several points in parallel
+    lo, hi = before[0]["regs"][3], max(a.count, b.count)
+    while hi - lo > 1:
+        width = hi - lo
+        targets = sorted({lo + width * (i + 1) // (probes + 1) for i in range(probes)} - {lo})
+        results = pool.map(_probe, [(before[0], before[1], t) for t in targets])
+        for target, (differ, snap_a, snap_b) in zip(targets, results):
+            if differ:
+                hi, after = target, (snap_a, snap_b)
+                break
+            lo, before = target, (snap_a, snap_b)
+    return before, after
+
+
+def _word(wd):
+    "format a memory word"
+    return f'{"-" if wd >> 24 else "+"}{wd & 0x00FFFFFF:08o}'
+
+
+def report(names, after):
+    "Print the instruction where the runs differ and the differing state"
+    a, b = Run.restore(after[0]), Run.restore(after[1])
+    print(f"Runs differ after instruction {min(a.count, b.count)}")
+    for name, run in zip(names, (a, b)):
+        if run.last:
+            pc, inst, result = run.last
+            mnem = MNEMONICS.get(inst >> 18 & 0o77, "???")
+            print(f"  {name}: {run.count: 5d}  {pc:04o}: {inst:08o} {mnem} .. {result}")
+        if run.done:
+            print(f"  {name}: script finished")
+    da, db = a.d, b.d
+    rows = []
+    if da.instruction_count != db.instruction_count:
+        rows.append(("Icnt", str(da.instruction_count), str(db.instruction_count)))
+    if da.pc != db.pc:
+        rows.append(("PC", f"{da.pc:04o}", f"{db.pc:04o}"))
+    for reg, ra, rb in (("A", da.a, db.a), ("B", da.b, db.b)):
+        if ra != rb:
+            rows.append((reg, _word(ra[0] << 24 | ra[1]), _word(rb[0] << 24 | rb[1])))
+    diffs = [addr for addr in range(4096) if da.mem[addr] != db.mem[addr]]
+    for addr in diffs[:20]:
+        rows.append((f"{addr:04o}", _word(da.mem[addr]), _word(db.mem[addr])))
+    if len(diffs) > 20:
+        rows.append(("...", f"{len(diffs)} words differ", ""))
+    for item, va, vb in rows:
+        print(f"  {item:6s} {va:>12s} {vb:>12s}")
+
+
+def main():
+    "Parse the command line and search for the first divergence"
+    parser = ArgumentParser(
+        description="Find the first instruction where two simulator command scripts differ",
+        epilog="Type In data must be attached with ATTACH TI, the keyboard is not read.",
+    )
+    parser.add_argument("script_a", help="sim3080.py command file for the first run")
+    parser.add_argument("script_b", help="sim3080.py command file for the second run")
+    parser.add_argument("-n", "--max-instructions", type=int, default=10**8, metavar="N")
+    parser.add_argument("-k", "--checkpoint", type=int, default=100000, help="checkpoint interval")
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the initial memory")
+    args = parser.parse_args()
+
+    scripts = []
+    for path in (args.script_a, args.script_b):
+        try:
+            with open(path) as f:
+                scripts.append(f.readlines())
+            check_script(scripts[-1])
+        except (OSError, ValueError) as e:
+            exit(f"{path}: {e}")
+    rng = Random(args.seed)  # both runs start with the same memory
+    image = [rng.randrange(2) << 24 | rng.randrange(1 << 24) for addr in range(4096)]
+    probes = max(2, args.jobs)
+    saved, sys.stdout = sys.stdout, open(devnull, "w")
+    try:
+        with Pool(args.jobs, _quiet) as pool:
+            found = find_divergence(
+                scripts[0],
+                scripts[1],
+                image,
+                args.checkpoint,
+                args.max_instructions,
+                pool,
+                probes,
+                (args.script_a, args.script_b),
+            )
+    finally:
+        sys.stdout.close()
+        sys.stdout = saved
+    if not found:
+        print("No difference found")
+        return 0
+    report((args.script_a, args.script_b), found[1])
+    return 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+"fuzz3080.py - Random program fuzz testing of the Digiac-3080 emulator"
+
+#   Copyright (C) 2020 Robert N. Evans
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from argparse import ArgumentParser
+from array import array
+from importlib import import_module
+from io import StringIO
+from multiprocessing import Pool, cpu_count
+from os import devnull
+from random import Random
+from time import perf_counter
+import sys
+from digiac import Digiac3080
+
+_OPCODES = sorted(Digiac3080._implemented_instructions)
+_MAG = 0x00FFFFFF
+
+
+class Case:
+    "A reproducible fuzz test: memory image, initial registers and instruction count"
+
+    def __init__(self, mem, pc, a, b, steps):
+        self.mem = mem  # array of 4096 words
+        self.pc = pc
+        self.a = a
+        self.b = b
+        self.steps = steps
+
+    @classmethod
+    def random(cls, seed, steps):
+        "generate a random program and data image from seed"
+        rng = Random(seed)
+        ops = _OPCODES
+        n = len(ops)
+        # low 2 bits pick data (1 in 4) or instruction, then bits for the word
+        mem = array(
+            "L",
+            [
+                (
+                    ops[(w >> 2) % n] << 18 | (w >> 8 & 0o77) << 12 | w >> 14 & 0o7777
+                    if w & 3
+                    else w >> 26 & 0x01FFFFFF
+                )
+                for w in array("Q", rng.randbytes(8 * 4096))
+            ],
+        )
+        a = (rng.randrange(2), rng.randrange(1 << 24))
+        b = (rng.randrange(2), rng.randrange(1 << 24))
+        return cls(mem, rng.randrange(4096), a, b, steps)
+
+    def script(self, addrs):
+        "sim3080.py commands that reproduce this case using memory words addrs"
+        lines = [f"# fuzz3080 reproducer, {self.steps} instructions", "throttle 0"]
+        lines.append(f"attach ti {devnull}")
+        for addr in sorted(addrs):
+            wd = self.mem[addr]
+            lines.append(f'deposit {addr:04o} {"-" if wd >> 24 else ""}{wd & _MAG:08o}')
+        for reg, (sgn, val) in (("a", self.a), ("b", self.b)):
+            lines.append(f'deposit {reg} {"-" if sgn else ""}{val:08o}')
+        lines += [f"deposit pc {self.pc:04o}", "trace 1"]
+        lines += ["step"] * self.steps  # one at a time to continue past stops
+        return "\n".join(lines)
+
+
+def _reset(d, case):
+    "load the case into machine d"
+    d.mem = array("L", case.mem)
+    d.pc = case.pc
+    d.a = case.a
+    d.b = case.b
+    d.instruction_count = 0
+    d.ips = 0
+    d.bpt = []
+    d.acs = []
+    d.ptr = None  # RT stops with no tape
+    d.ti = StringIO()  # TI stops at end of data
+    d.run = True
+
+
+def _check(d):
+    "return the name of a violated machine state invariant, or None"
+    if not 0 <= d.pc < 4096:
+        return "pc"
+    for name, (sgn, val) in (("A", d.a), ("B", d.b)):
+        if sgn not in (0, 1) or not 0 <= val <= _MAG:
+            return name
+    return None
+
+
+def _state(d):
+    "machine state compared between engines"
+    return d.pc, d.a, d.b
+
+
+def run_case(d, case, engine=None):
+    "Run case on d (and engine), return None or (kind, message, step)"
+    _reset(d, case)
+    if engine is not None:
+        _reset(engine, case)
+    for step in range(1, case.steps + 1):
+        pc = d.pc
+        try:
+            d.exec()
+        except Exception as e:
+            return f"exception {type(e).__name__}", f"{e!r} at {pc:04o}", step
+        bad = _check(d)
+        if bad:
+            return f"invariant {bad}", f"{bad} out of range at {pc:04o}: {d}", step
+        if engine is not None:
+            try:
+                engine.exec()
+            except Exception as e:
+                return f"engine exception {type(e).__name__}", f"{e!r} at {pc:04o}", step
+            if _state(d) != _state(engine) or d.mem != engine.mem:
+                return "mismatch", f"engines differ after {pc:04o}: {d} vs {engine}", step
+        d.run = True  # keep running through HLT and other stop conditions
+    if max(d.mem) >> 25:
+        return "invariant mem", "memory word wider than 25 bits", case.steps
+    return None
+
+
+def _used_addresses(case):
+    "addresses read or written while running case"
+    used = set()
+
+    class Recorder(Digiac3080):
+        def rm(self, addr):
+            used.add(addr)
+            return super().rm(addr)
+
+        def wm(self, addr, val):
+            used.add(addr)
+            super().wm(addr, val)
+
+    d = Recorder()
+    _reset(d, case)
+    for step in range(case.steps):
+        try:
+            d.exec()
+        except Exception:
+            break
+        d.run = True
+    return used
+
+
+def _advance(d, case, count):
+    "the case that starts where case is after count instructions"
+    _reset(d, case)
+    for step in range(count):
+        d.exec()
+        d.run = True
+    return Case(array("L", d.mem), d.pc, d.a, d.b, case.steps - count)
+
+
+def minimize(d, case, kind, engine=None):
+    "Shrink a failing case to few instructions and few nonzero memory words"
+
+    def fails(c):
+        r = run_case(d, c, engine)
+        return r is not None and r[0] == kind
+
+    # the failure happens at a known step, so no more instructions are needed
+    case.steps = run_case(d, case, engine)[2]
+    # start as late as possible in the run
+    lo, hi = 0, case.steps - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fails(_advance(d, case, mid)):
+            lo = mid
+        else:
+            hi = mid - 1
+    case = _advance(d, case, lo)
+    # words never read or written cannot matter
+    used = _used_addresses(case)
+    case.mem = array("L", (wd if addr in used else 0 for addr, wd in enumerate(case.mem)))
+    # clear chunks of the used words (to HLT) while the same failure persists
+    addrs = sorted(used)
+    chunk = len(addrs) // 2
+    while chunk:
+        for start in range(0, len(addrs), chunk):
+            group = [addr for addr in addrs[start : start + chunk] if case.mem[addr]]
+            if not group:
+                continue
+            trial = Case(array("L", case.mem), case.pc, case.a, case.b, case.steps)
+            for addr in group:
+                trial.mem[addr] = 0
+            if fails(trial):
+                case = trial
+        chunk //= 2
+    # clear registers too
+    for reg in ("a", "b"):
+        if getattr(case, reg) != (0, 0):
+            trial = Case(case.mem, case.pc, case.a, case.b, case.steps)
+            setattr(trial, reg, (0, 0))
+            if fails(trial):
+                case = trial
+    case.steps = run_case(d, case, engine)[2]
+    return case
+
+
+_worker = {}
+
+
+def _init_worker(engine_spec):
+    "create the machines used by one worker process"
+    sys.stdout = open(devnull, "w")  # TA output is not interesting
+    _worker["d"] = Digiac3080()
+    _worker["engine"] = load_engine(engine_spec) if engine_spec else None
+
+
+def _fuzz_batch(job):
+    "run a batch of seeds in a worker process, return (instructions, failures)"
+    first, count, steps = job
+    d, engine = _worker["d"], _worker["engine"]
+    instructions = 0
+    failures = []
+    for seed in range(first, first + count):
+        case = Case.random(seed, steps)
+        result = run_case(d, case, engine)
+        if result:
+            failures.append((seed,) + result)
+            instructions += result[2]
+        else:
+            instructions += steps
+    return instructions, failures
+
+
+def load_engine(spec):
+    "create an alternate engine from 'module:Class'"
+    module, sep, name = spec.partition(":")
+    return getattr(import_module(module), name or "Digiac3080")()
+
+
+def main():
+    "Parse the command line and run the fuzz campaign"
+    parser = ArgumentParser(description="Fuzz test the Digiac-3080 emulator")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="first case seed")
+    parser.add_argument("-n", "--cases", type=int, default=10000, help="number of cases")
+    parser.add_argument("--steps", type=int, default=1000, help="instructions per case")
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count(), help="worker processes")
+    parser.add_argument("--batch", type=int, default=100, help="cases per work unit")
+    parser.add_argument("--engine", help="alternate engine 'module:Class' to compare")
+    parser.add_argument("-x", "--max-failures", type=int, default=1, help="stop after this many")
+    args = parser.parse_args()
+
+    try:  # a bad engine would kill each worker process as it starts
+        engine = load_engine(args.engine) if args.engine else None
+    except Exception as e:
+        exit(f"Cannot load engine {args.engine}: {e}")
+    jobs = [
+        (seed, min(args.batch, args.seed + args.cases - seed), args.steps)
+        for seed in range(args.seed, args.seed + args.cases, args.batch)
+    ]
+    total = 0
+    failures = []
+    start = perf_counter()
+    with Pool(args.jobs, _init_worker, (args.engine,)) as pool:
+        for instructions, found in pool.imap_unordered(_fuzz_batch, jobs):
+            total += instructions
+            failures += found
+            if len(failures) >= args.max_failures:
+                pool.terminate()
+                break
+    elapsed = perf_counter() - start
+    print(f"{total} instructions in {elapsed:.1f}s, {total / elapsed * 60:,.0f} per minute")
+
+    d = Digiac3080()
+    for seed, kind, msg, step in sorted(failures)[: args.max_failures]:
+        print(f"\nseed {seed}: {kind} at instruction {step}: {msg}")
+        saved, sys.stdout = sys.stdout, open(devnull, "w")
+        try:
+            case = minimize(d, Case.random(seed, args.steps), kind, engine)
+            addrs = _used_addresses(case)
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved
+        print(case.script(addrs))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+"hostprof3080.py - Measure host time spent in the Digiac-3080 emulator's own code"
+
+#   Copyright (C) 2020 Robert N. Evans
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from time import perf_counter_ns
+from trace3080 import MNEMONICS
+
+# What may be timed: exec, the _inst_* instruction handlers and these Digiac3080 methods
+METHODS = ("rm", "wm", "_arg_fetch", "_shift", "_sign")
+ALL = ("exec", "handlers") + METHODS
+DEFAULT = ("exec",)  # nothing nested, so the opcode times are not inflated
+
+
+def _calls(stat):
+    "format call count, total and self ms, and ns per call"
+    calls, ns, own = stat
+    per = ns // calls if calls else 0
+    return f"{calls:10d} {ns / 1e6:10.1f} {own / 1e6:10.1f} {per:8d}"
+
+
+class HostProfiler:
+    "Time emulator methods with perf_counter_ns while enabled"
+
+    def __init__(self, d, shell=None, methods=DEFAULT):
+        "profile methods (names from ALL) of the Digiac3080 d and optionally a SimShell run loop"
+        unknown = sorted(set(methods) - set(ALL))
+        if unknown:
+            raise ValueError(f"Cannot profile: {' '.join(unknown)}")
+        self.d = d
+        self.shell = shell
+        self.methods = tuple(methods)
+        self.enabled = False
+        self.stats = {}  # name: [calls, ns, self ns]
+        self.opcodes = {}  # opcode: [calls, ns] for exec
+        self._inner = [0]  # ns spent in timed calls made by the running timed call
+        self._waited = [0]  # ns slept by the throttle or pacing, left out of all times
+        self._wrapped = []  # (object, attribute) of the installed wrappers
+
+    def reset(self):
+        "discard the measurements"
+        for stat in list(self.stats.values()) + list(self.opcodes.values()):
+            stat[:] = [0] * len(stat)  # in place, the wrappers hold these lists
+        self._waited[0] = 0
+
+    def _timed(self, name, fn, per_call=None):
+        "wrap fn so each call adds to the stats for name, self time excludes nested timed calls"
+        stat = self.stats.setdefault(name, [0, 0, 0])
+        inner = self._inner
+        waited = self._waited
+
+        def timed(*args, **kwargs):
+            outer = inner[0]
+            inner[0] = 0
+            slept = waited[0]
+            t = perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = perf_counter_ns() - t - (waited[0] - slept)
+                stat[0] += 1
+                stat[1] += dt
+                stat[2] += dt - inner[0]
+                inner[0] = outer + dt
+                if per_call:
+                    per_call(dt)
+
+        return timed
+
+    def _install(self, obj, name, fn):
+        "set a wrapper as an instance attribute, shadowing the class"
+        setattr(obj, name, fn)
+        self._wrapped.append((obj, name))
+
+    def start(self):
+        "begin timing; wrappers are installed on the instances only"
+        if self.enabled:
+            return
+        d = self.d
+        wait, waited = d._wait, self._waited
+
+        def wait_untimed():
+            t = perf_counter_ns()
+            try:
+                wait()
+            finally:
+                waited[0] += perf_counter_ns() - t
+
+        self._install(d, "_wait", wait_untimed)
+        for name in METHODS:
+            if name in self.methods:
+                self._install(d, name, self._timed(name, getattr(d, name)))
+        if "handlers" in self.methods:
+            handlers = type(d)._implemented_instructions
+            handlers = {op: self._timed(fn.__name__, fn) for op, fn in handlers.items()}
+            self._install(d, "_implemented_instructions", handlers)
+        if "exec" in self.methods:
+            opcodes = self.opcodes
+            icount = [0]
+
+            def per_opcode(dt):
+                if d.instruction_count != icount[0]:  # not stopped at a breakpoint
+                    stat = opcodes.setdefault(d._opcode, [0, 0])
+                    stat[0] += 1
+                    stat[1] += dt
+
+            exec_fn = self._timed("exec", d.exec, per_opcode)
+
+            def exec_timed():
+                icount[0] = d.instruction_count
+                return exec_fn()
+
+            self._install(d, "exec", exec_timed)
+        if self.shell:
+            loop_stat = self.stats.setdefault("shell loop", [0, 0, 0])
+            run = self._timed("shell loop", self.shell.run_virtual_machine)
+
+            def run_timed(*args, **kwargs):
+                icount = d.instruction_count
+                calls = loop_stat[0]
+                try:
+                    return run(*args, **kwargs)
+                finally:
+                    loop_stat[0] = calls + d.instruction_count - icount  # per instruction
+
+            self._install(self.shell, "run_virtual_machine", run_timed)
+        self.enabled = True
+
+    def stop(self):
+        "stop timing and remove the wrappers"
+        for obj, name in self._wrapped:
+            delattr(obj, name)
+        self._wrapped = []
+        self.enabled = False
+
+    def overhead(self):
+        "estimated ns added to each timed call by the profiler"
+        timed = self._timed("calibrate", lambda: None)
+        for i in range(10000):
+            timed()
+        calls, ns, own = self.stats.pop("calibrate")
+        return ns // calls
+
+    def report(self):
+        "Return a table of host time per emulator method and per guest opcode"
+        head = f"{'calls':>10s} {'total ms':>10s} {'self ms':>10s} {'ns/call':>8s}"
+        lines = [f"{'Host time':18s} {head}"]
+        for name, stat in sorted(self.stats.items(), key=lambda x: -x[1][1]):
+            if stat[0]:
+                lines.append(f"{name:18s} {_calls(stat)}")
+        total = sum(ns for calls, ns in self.opcodes.values())
+        if total:
+            lines.append("")
+            lines.append(f"{'Opcode (exec)':18s} {'calls':>10s} {'total ms':>10s} {'ns/call':>8s}")
+            for op, (calls, ns) in sorted(self.opcodes.items(), key=lambda x: -x[1][1]):
+                name = f"{op:02o} {MNEMONICS.get(op, '???')}"
+                pct = ns * 100 / total
+                lines.append(
+                    f"{name:18s} {calls:10d} {ns / 1e6:10.1f} {ns // calls:8d} {pct:5.1f}%"
+                )
+        lines.append("")
+        lines.append(f"Self time excludes nested timed calls, which add about {self.overhead()} ns")
+        if len(self.methods) > 1:
+            lines.append("each to their caller; time exec alone for accurate opcode times")
+        if self._waited[0]:
+            lines.append(f"Throttle and pace sleeps ({self._waited[0] / 1e6:.1f} ms) are left out")
+        return "\n".join(lines)
@@ -16,9 +16,14 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from argparse import ArgumentParser
 from cmd import Cmd
+from contextlib import nullcontext, redirect_stdout
 from pdb import set_trace
+from sys import exit
 from digiac import Digiac3080
+from hostprof3080 import ALL, HostProfiler
+from trace3080 import TraceFilter, TraceWriter
 
 d = Digiac3080()
 
@@ -40,9 +45,18 @@ class SimShell(Cmd):
     intro = "Welcome to the Digiac-3080.  Type help or ? to list commands.\n"
     prompt = "Dg> "
     use_rawinput = False
-    digi_known_devices = ("ptr",)
+    digi_known_devices = ("ptr", "ti")
     digi_known_registers = ("a", "b", "pc")
     digi_trace = 0  # bitmask?
+    digi_recorder = None  # TraceWriter for binary trace records
+    digi_hostprof = None  # HostProfiler for the emulator's own code
+    digi_budget = None  # stop once the instruction count reaches this limit
+    digi_quiet = False  # suppress the stop line printed after each run
+
+    def __init__(self, machine=None, **kwargs):
+        "machine is the Digiac3080 the commands act on, default the module's d"
+        super().__init__(**kwargs)
+        self.digi_d = d if machine is None else machine
 
     def emptyline(self):
         "Override default repeat of prior command on empty input line"
@@ -67,22 +81,39 @@ class SimShell(Cmd):
 
     def do_quit(self, arg):
         "Quit/Exit from the emulator: QUIT"
+        d = self.digi_d
         if d.ptp:
             d.ptp.close()
             d.ptp = None
         if d.ptr:
             d.ptr.close()
             d.ptr = None
+        if d.ti:
+            d.ti.close()
+            d.ti = None
+        if self.digi_recorder:
+            self.digi_recorder.close()
+            self.digi_recorder = None
+        d.console.close()
         return True
 
     # ----- Emulated device control -----
     def do_attach(self, arg):
-        "Attach file to device: ATTACH PTR <filepath>"
+        "Attach file to device: ATTACH PTR|TI <filepath>"
+        d = self.digi_d
         args = arg.split()
         if len(args) != 2:
             print("Two arguments must be provided")
         elif args[0].lower() not in self.digi_known_devices:
             print(f"Unknown device: {args[0]}")
+        elif args[0].lower() == "ti":
+            if d.ti:
+                d.ti.close()
+            try:
+                d.ti = open(args[1], "r", encoding="utf-8")
+            except OSError as e:
+                d.ti = None
+                print(e)
         else:  # FIXME needs expansion to handle multiple devices ...
             if d.ptr:
                 d.ptr.close()
@@ -93,12 +124,17 @@ class SimShell(Cmd):
                 print(e)
 
     def do_detach(self, arg):
-        "Detach file from a device: DETACH [PTP|PTR]"
+        "Detach file from a device: DETACH [PTP|PTR|TI]"
+        d = self.digi_d
         args = arg.split()
         if len(args) != 1:
             print("One argument must be provided")
         elif args[0].lower() not in self.digi_known_devices:
             print(f"Unknown device: {args[0]}")
+        elif args[0].lower() == "ti":
+            if d.ti:
+                d.ti.close()
+            d.ti = None
         else:  # FIXME needs expansion to handle multiple devices ...
             if d.ptr:
                 d.ptr.close()
@@ -111,6 +147,7 @@ class SimShell(Cmd):
 
     def do_examine(self, arg):
         "Examine memory or register: EXAMINE A|B|PC|####"
+        d = self.digi_d
         args = arg.split()
         if len(args) != 1:
             print("One argument must be provided")
@@ -139,6 +176,7 @@ class SimShell(Cmd):
 
     def do_deposit(self, arg):
         "Store a value in memory or reg: DEPOSIT A|B|PC|#### -12345670"
+        d = self.digi_d
         args = arg.split()
         if len(args) != 2:
             print("Two arguments must be provided")
@@ -177,32 +215,51 @@ class SimShell(Cmd):
     # ----- Instruction Execution -----
     def run_virtual_machine(self, num_instr=None):
         "Loop executing emulated instructions"
+        d = self.digi_d
         instr_cnt = 0
+        if self.digi_budget is not None and d.instruction_count >= self.digi_budget:
+            d.stop("budget")
+            if not self.digi_quiet:
+                print(f"Instruction budget {self.digi_budget} exhausted")
+            return
         d.run = True
+        d.stop_reason = None
         if d.pc in d.bpt:  # continuing from a BPT
             held_bpt = d.pc
             d.bpt.remove(held_bpt)
         else:
             held_bpt = None
-        while d.run:
-            pc = d.pc
-            inst = d.rm(pc)
-            try:
-                result = d.exec()
-                instr_cnt += 1
-            except KeyboardInterrupt:
-                d.run = False
-                result = "Control-C"
-            if held_bpt is not None:
-                d.bpt.append(held_bpt)
-                held_bpt = None
-            if (num_instr is not None) and (instr_cnt >= num_instr):
-                if num_instr > 1:
-                    print(f"Instruction count {instr_cnt} reached")
-                d.run = False
-            if self.digi_trace & 1:
-                print(f"{d.instruction_count: 5d}  {pc:04o}: {inst:08o} .. {result}")
-        if not self.digi_trace & 1:
+        recorder = self.digi_recorder
+        with d.console:  # terminal stays in keyboard mode for the run
+            while d.run:
+                pc = d.pc
+                inst = d.rm(pc)
+                icount = d.instruction_count
+                try:
+                    result = d.exec()
+                    instr_cnt += 1
+                    if recorder and d.instruction_count != icount:
+                        recorder.record(d, d.instruction_count, pc, inst)
+                except KeyboardInterrupt:
+                    d.stop("interrupt")
+                    result = "Control-C"
+                if held_bpt is not None:
+                    d.bpt.append(held_bpt)
+                    held_bpt = None
+                if (num_instr is not None) and (instr_cnt >= num_instr):
+                    if d.run:  # keep the reason if the instruction stopped the CPU
+                        if num_instr > 1 and not self.digi_quiet:
+                            print(f"Instruction count {instr_cnt} reached")
+                        d.stop("step")
+                if d.run and self.digi_budget is not None:
+                    if d.instruction_count >= self.digi_budget:
+                        d.stop("budget")
+                        result += f"  Instruction budget {self.digi_budget} exhausted"
+                if self.digi_trace & 1:
+                    print(f"{d.instruction_count: 5d}  {pc:04o}: {inst:08o} .. {result}")
+        if recorder:
+            recorder.flush()  # the trace file is complete between runs
+        if not self.digi_trace & 1 and not self.digi_quiet:
             print(f"{d.instruction_count: 5d}  {pc:04o}: {inst:08o} .. {result}")
 
     def do_s(self, arg):
@@ -229,6 +286,7 @@ class SimShell(Cmd):
 
     def do_go(self, arg):
         "Start or continue instruction execution: GO [addr]"
+        d = self.digi_d
         args = arg.split()
         if args:
             try:
@@ -242,6 +300,7 @@ class SimShell(Cmd):
 
     def do_throttle(self, arg):
         "Limit execution speed to given ips: THROTTLE [ips] (default=60 IPS, zero=no throttle)"
+        d = self.digi_d
         args = arg.split()
         if args:
             try:
@@ -253,6 +312,35 @@ class SimShell(Cmd):
         else:
             print(f"{d.ips} Instr/sec" if d.ips else "not throttled")
 
+    def do_clock(self, arg):
+        "Emulated time: CLOCK [RESET|PACE|FREE|COST <opcode> [cycles]]"
+        d = self.digi_d
+        args = arg.lower().split()
+        if not args:
+            pace = "paced to wall-clock" if d.pace else "not paced"
+            us = d.cycle_time * 1e6
+            print(f"Emulated time: {d.elapsed:.3f}s ({d.cycles} cycles of {us:g}us) {pace}")
+        elif args[0] == "reset":
+            d.cycles = 0
+        elif args[0] == "pace":
+            d.pace = True
+        elif args[0] == "free":
+            d.pace = False
+        elif args[0] == "cost" and len(args) in (2, 3):
+            try:
+                op = int(args[1], 8)
+                assert 0 <= op <= 0o77
+                if len(args) == 3:
+                    cycles = int(args[2])
+                    assert cycles >= 0
+                    d.cycle_costs[op] = cycles
+            except:
+                print(f'Invalid opcode or cycles: "{" ".join(args[1:])}"')
+                return
+            print(f"Opcode {op:02o}: {d.cycle_costs[op]} cycles")
+        else:
+            print(f'Invalid clock argument: "{arg}"')
+
     def do_trace(self, arg):
         "Set/clear tracing opions: TRACE 0|1"
         args = arg.split()
@@ -266,9 +354,60 @@ class SimShell(Cmd):
         else:
             print(f"trace flags: {self.digi_trace:02X}h")
 
+    def do_hostprof(self, arg):
+        "Time the emulator's own code on the host: HOSTPROF ON [ALL|<name>..]|OFF|REPORT|RESET"
+        d = self.digi_d
+        args = arg.lower().split()
+        if self.digi_hostprof is None:
+            self.digi_hostprof = HostProfiler(d, self)
+        prof = self.digi_hostprof
+        if not args:
+            print("host profiling on" if prof.enabled else "host profiling off")
+        elif args[0] == "on" and args[1:]:
+            try:
+                new = HostProfiler(d, self, ALL if args[1:] == ["all"] else args[1:])
+            except ValueError as e:
+                print(f"{e}; choose from: all {' '.join(ALL)}")
+                return
+            prof.stop()
+            self.digi_hostprof = new
+            new.start()
+        elif args[0] == "on":
+            prof.start()
+        elif args[0] == "off":
+            prof.stop()
+        elif args[0] == "report":
+            print(prof.report())
+        elif args[0] == "reset":
+            prof.reset()
+        else:
+            print(f'Invalid hostprof argument: "{arg}"')
+
+    def do_record(self, arg):
+        "Record binary trace: RECORD <file> [pc=lo-hi] [op=class,..] [icount=first-last] | OFF"
+        args = arg.split()
+        if not args:
+            rec = self.digi_recorder
+            if rec:
+                print(f"{rec.records} records to {rec.path} filter: {rec.filter or 'all'}")
+            else:
+                print("not recording")
+            return
+        if self.digi_recorder:
+            self.digi_recorder.close()
+            self.digi_recorder = None
+        if args[0].lower() == "off":
+            return
+        try:
+            tfilter = TraceFilter.from_args(args[1:])
+            self.digi_recorder = TraceWriter(args[0], tfilter if args[1:] else None)
+        except (ValueError, OSError) as e:
+            print(e)
+
     # ----- Breakpoints -----
     def do_break(self, arg):
         "Set breakpoint at addr: BREAK [1234]"
+        d = self.digi_d
         args = arg.split()
         if args:
             try:
@@ -285,6 +424,7 @@ class SimShell(Cmd):
 
     def do_clear(self, arg):
         "Clear breakpoint at addr: CLEAR 1234"
+        d = self.digi_d
         args = arg.split()
         if len(args) == 1:
             try:
@@ -300,6 +440,7 @@ class SimShell(Cmd):
 
     def do_acstop(self, arg):
         "Set an address compare stop addr: ACSTOP <addr>"
+        d = self.digi_d
         args = arg.split()
         if args:
             try:
@@ -316,6 +457,7 @@ class SimShell(Cmd):
 
     def do_aclear(self, arg):
         "Clear an address compare stop addr: ACLEAR <addr>"
+        d = self.digi_d
         args = arg.split()
         if len(args) == 1:
             try:
@@ -331,8 +473,104 @@ class SimShell(Cmd):
 
     def do_status(self, arg):
         "Show emulator status: STATUS"
+        d = self.digi_d
         print(d)
 
 
+# Process exit status for each reason the CPU can stop in batch mode
+EXIT_STATUS = {
+    None: 0,  # never ran
+    "halt": 0,
+    "step": 0,
+    "invalid": 10,
+    "divide": 11,
+    "budget": 12,
+    "breakpoint": 13,
+    "acstop": 14,
+    "tape": 15,
+    "input": 16,
+    "interrupt": 130,
+}
+
+
+def run_batch(shell, lines):
+    "Execute simulator commands without prompting, return the exit status"
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue  # skip blank and comment lines
+        if shell.onecmd(shell.precmd(line)):
+            break
+    shell.do_quit("")
+    return EXIT_STATUS[shell.digi_d.stop_reason]
+
+
+def main():
+    "Run the simulator interactively or, given commands, in batch mode"
+    parser = ArgumentParser(
+        description="Digiac-3080 simulator",
+        epilog="Batch exit status: 0 halt, 10 invalid opcode, 11 divide stop, "
+        + "12 instruction budget, 13 breakpoint, 14 address compare stop, "
+        + "15 paper tape, 16 end of Type In data, 130 Control-C",
+    )
+    parser.add_argument("script", nargs="?", help="file of simulator commands to run")
+    parser.add_argument(
+        "-c",
+        dest="commands",
+        action="append",
+        default=[],
+        help="simulator commands to run, separated by ';' (may be repeated)",
+    )
+    parser.add_argument("-i", "--input", help="file of Type In data (instead of keyboard)")
+    parser.add_argument("-o", "--output", help="write simulator output to this file")
+    parser.add_argument(
+        "-n",
+        "--max-instructions",
+        type=int,
+        metavar="N",
+        help="stop once N instructions have been executed",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="do not print the stop line after each run",
+    )
+    args = parser.parse_args()
+
+    shell = SimShell()
+    shell.digi_budget = args.max_instructions
+    shell.digi_quiet = args.quiet
+    if args.input:
+        try:
+            shell.digi_d.ti = open(args.input, "r", encoding="utf-8")
+        except OSError as e:
+            exit(e)
+    lines = []
+    for cmds in args.commands:
+        lines.extend(cmds.split(";"))
+    if args.script:
+        try:
+            with open(args.script) as f:
+                lines.extend(f)
+        except OSError as e:
+            exit(e)
+
+    try:
+        out = open(args.output, "w") if args.output else None
+    except OSError as e:
+        exit(e)
+    try:
+        with redirect_stdout(out) if out else nullcontext():
+            if lines:
+                shell.digi_d.ips = 0  # batch jobs run at full speed unless THROTTLE is used
+                return run_batch(shell, lines)
+            shell.cmdloop()
+            return 0
+    finally:
+        if out:
+            out.close()
+
+
 if __name__ == "__main__":
-    SimShell().cmdloop()
+    exit(main())
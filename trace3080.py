@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+"trace3080.py - Binary instruction trace records for the Digiac-3080 emulator"
+
+#   Copyright (C) 2020 Robert N. Evans
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from struct import Struct
+
+# A trace file is MAGIC followed by fixed-size little-endian records:
+#   icount, pc, instruction word, A, B (as sign << 24 | magnitude),
+#   first memory address written (NO_WRITE if none), count of words written,
+#   last word written.
+MAGIC = b"D3080TR1"
+RECORD = Struct("<QHIIIHHI")
+NO_WRITE = 0xFFFF
+BUFFER_SIZE = 1 << 20  # bytes of records collected before each write
+
+# fmt: off
+MNEMONICS = {
+    0o00: "HLT",
+    0o04: "AND", 0o05: "AND", 0o06: "AND", 0o07: "AND",
+    0o10: "CLA", 0o11: "CLS", 0o12: "CLA", 0o13: "CLA",
+    0o14: "ADD", 0o15: "SUB", 0o16: "ADD", 0o17: "ADD",
+    0o20: "MLT", 0o21: "MLT", 0o22: "MLT", 0o23: "MLT",
+    0o24: "DIV", 0o25: "DIV", 0o26: "DIV", 0o27: "DIV",
+    0o30: "STA", 0o31: "STA", 0o32: "STA", 0o33: "STA",
+    0o34: "STB", 0o35: "STB", 0o36: "STB", 0o37: "STB",
+    0o44: "JMP", 0o45: "BR-", 0o46: "BR+", 0o47: "BRZ",
+    0o50: "TO",  0o54: "TA",  0o60: "RT",  0o62: "RC",  0o63: "TI",  0o64: "PT",
+}
+
+# Opcode classes that may be selected by a trace filter
+OPCODE_CLASSES = {
+    "hlt":    frozenset((0o00,)),
+    "logic":  frozenset(range(0o04, 0o10)),
+    "load":   frozenset(range(0o10, 0o14)),
+    "arith":  frozenset(range(0o14, 0o30)),
+    "store":  frozenset(range(0o30, 0o40)),
+    "branch": frozenset(range(0o44, 0o50)),
+    "io":     frozenset((0o50, 0o54, 0o60, 0o62, 0o63, 0o64)),
+}
+# fmt: on
+
+_STORES = OPCODE_CLASSES["store"]
+_READS = frozenset((0o60, 0o63))  # RT and TI write memory
+
+
+def opcode_set(names):
+    "Union of the opcodes in a comma separated list of class names or octal opcodes"
+    ops = set()
+    for name in names.lower().split(","):
+        if name in OPCODE_CLASSES:
+            ops |= OPCODE_CLASSES[name]
+        else:
+            try:
+                op = int(name, 8)
+                assert 0 <= op <= 0o77
+            except:
+                raise ValueError(f'Unknown opcode class "{name}"') from None
+            ops.add(op)
+    return frozenset(ops)
+
+
+def parse_range(text, maximum):
+    "Parse 'lo-hi', 'lo-' or 'lo' with octal addresses into an inclusive (lo, hi)"
+    lo, sep, hi = text.partition("-")
+    lo = int(lo, 8) if lo else 0
+    hi = int(hi, 8) if hi else (maximum if sep else lo)
+    if not 0 <= lo <= hi <= maximum:
+        raise ValueError(f'Invalid range "{text}"')
+    return lo, hi
+
+
+class TraceFilter:
+    "Select trace records by PC range, opcode and instruction count window"
+
+    def __init__(self, pc=None, opcodes=None, icount=None):
+        "any criterion left as None selects everything"
+        self.pc = pc  # inclusive (lo, hi) addresses
+        self.opcodes = opcodes  # set of 6-bit opcodes
+        self.icount = icount  # inclusive (first, last) instruction counts
+
+    def __str__(self):
+        "format object for printing"
+        s = []
+        if self.pc:
+            s.append(f"pc={self.pc[0]:04o}-{self.pc[1]:04o}")
+        if self.opcodes is not None:
+            s.append("op=" + ",".join(f"{op:02o}" for op in sorted(self.opcodes)))
+        if self.icount:
+            s.append(f"icount={self.icount[0]}-{self.icount[1]}")
+        return " ".join(s) if s else "all"
+
+    def match(self, icount, pc, instr):
+        "whether an instruction is selected"
+        if self.pc and not self.pc[0] <= pc <= self.pc[1]:
+            return False
+        if self.opcodes is not None and instr >> 18 & 0o77 not in self.opcodes:
+            return False
+        if self.icount and not self.icount[0] <= icount <= self.icount[1]:
+            return False
+        return True
+
+    @classmethod
+    def from_args(cls, args):
+        "build a filter from words like pc=100-177 op=store,branch icount=1000-2000"
+        f = cls()
+        for arg in args:
+            key, sep, val = arg.partition("=")
+            key = key.lower()
+            if not sep:
+                raise ValueError(f'Expected key=value, got "{arg}"')
+            if key == "pc":
+                f.pc = parse_range(val, 0o7777)
+            elif key == "op":
+                f.opcodes = opcode_set(val)
+            elif key == "icount":
+                first, sep, last = val.partition("-")
+                first = int(first) if first else 0
+                last = int(last) if last else ((1 << 64) - 1 if sep else first)
+                f.icount = (first, last)
+            else:
+                raise ValueError(f'Unknown trace filter "{key}"')
+        return f
+
+
+class TraceWriter:
+    "Append binary trace records for executed instructions to a file"
+
+    def __init__(self, path, filter=None):
+        "open the trace file, replacing any existing content"
+        self.path = path
+        self.filter = filter
+        self.records = 0
+        self._buf = bytearray()
+        self._pack = RECORD.pack
+        self._f = open(path, "wb")
+        self._f.write(MAGIC)
+
+    def record(self, d, icount, pc, instr):
+        "record the state of machine d after it executed instr fetched from pc"
+        f = self.filter
+        if f and not f.match(icount, pc, instr):
+            return
+        op = instr >> 18 & 0o77
+        if op in _STORES:
+            waddr = instr & 0o7777
+            wcnt = 1
+            wval = d.mem[waddr]
+        elif op in _READS:
+            waddr = instr & 0o7777
+            wcnt = d._addr - waddr & 0o7777
+            wval = d.mem[d._addr - 1 & 0o7777] if wcnt else 0
+            if not wcnt:
+                waddr = NO_WRITE
+        else:
+            waddr, wcnt, wval = NO_WRITE, 0, 0
+        a, b = d.a, d.b
+        a = a[0] << 24 | a[1]
+        b = b[0] << 24 | b[1]
+        buf = self._buf
+        buf += self._pack(icount, pc, instr, a, b, waddr, wcnt, wval)
+        self.records += 1
+        if len(buf) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        "write buffered records to the file"
+        self._f.write(self._buf)
+        self._f.flush()
+        self._buf.clear()
+
+    def close(self):
+        "flush and close the trace file"
+        self.flush()
+        self._f.close()
+
+
+def read_trace(path):
+    "Generate the record tuples stored in a trace file"
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Digiac-3080 trace file")
+        size = RECORD.size
+        chunk = BUFFER_SIZE // size * size
+        while True:
+            buf = f.read(chunk)
+            if len(buf) % size:
+                buf = buf[: len(buf) // size * size]  # drop a truncated final record
+            if not buf:
+                break
+            yield from RECORD.iter_unpack(buf)
+
+
+def format_record(rec):
+    "Format a trace record tuple like the simulator's text trace"
+    icount, pc, instr, a, b, waddr, wcnt, wval = rec
+    mnem = MNEMONICS.get(instr >> 18 & 0o77, "???")
+    s = (
+        f"{icount: 5d}  {pc:04o}: {instr:08o} {mnem:3s} "
+        + f'A: {"-" if a >> 24 else "+"}{a & 0xFFFFFF:08o} '
+        + f'B: {"-" if b >> 24 else "+"}{b & 0xFFFFFF:08o}'
+    )
+    if waddr != NO_WRITE:
+        val = f'{"-" if wval >> 24 else "+"}{wval & 0xFFFFFF:08o}'
+        s += f"  [{waddr:04o}] <- {val}"
+        if wcnt > 1:
+            s += f" ({wcnt} words)"
+    return s
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"trace_dump.py - Decode, search and compare Digiac-3080 binary trace files"
+
+#   Copyright (C) 2020 Robert N. Evans
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from argparse import ArgumentParser
+from itertools import zip_longest
+from trace3080 import NO_WRITE, TraceFilter, format_record, parse_range, read_trace
+
+_FIELDS = ("icount", "pc", "instr", "A", "B", "write addr", "write count", "write value")
+
+
+def show(args):
+    "Print the records of a trace that match the filter and search options"
+    tfilter = TraceFilter.from_args(args.filter)
+    write = parse_range(args.write, 0o7777) if args.write else None
+    shown = 0
+    for rec in read_trace(args.trace):
+        if not tfilter.match(rec[0], rec[1], rec[2]):
+            continue
+        if args.instr is not None and rec[2] != args.instr:
+            continue
+        if write:
+            waddr, wcnt = rec[5], rec[6]
+            if waddr == NO_WRITE:
+                continue
+            last = waddr + wcnt - 1
+            if last < write[0] or waddr > write[1]:
+                continue  # wraparound of a multi-word write is not searched
+        print(format_record(rec))
+        shown += 1
+        if args.limit and shown >= args.limit:
+            break
+
+
+def diff(args):
+    "Print the records where two traces first differ"
+    found = 0
+    for idx, (r1, r2) in enumerate(zip_longest(read_trace(args.trace1), read_trace(args.trace2))):
+        if r1 == r2:
+            continue
+        if r1 is None or r2 is None:
+            short = args.trace1 if r1 is None else args.trace2
+            print(f"record {idx}: {short} ended")
+            print("< " + format_record(r1) if r1 else "<")
+            print("> " + format_record(r2) if r2 else ">")
+            found += 1
+            break
+        fields = ", ".join(name for name, v1, v2 in zip(_FIELDS, r1, r2) if v1 != v2)
+        print(f"record {idx}: {fields} differ")
+        print("< " + format_record(r1))
+        print("> " + format_record(r2))
+        found += 1
+        if found >= args.limit:
+            break
+    else:
+        if not found:
+            print("traces are identical")
+    return 1 if found else 0
+
+
+def main():
+    "Parse the command line and run the selected action"
+    parser = ArgumentParser(description="Decode Digiac-3080 binary trace files")
+    sub = parser.add_subparsers(dest="action", required=True)
+    p = sub.add_parser("show", help="decode and search a trace")
+    p.add_argument("trace", help="trace file written by the RECORD command")
+    p.add_argument(
+        "filter",
+        nargs="*",
+        help="pc=lo-hi (octal), op=class|opcode,.. or icount=first-last",
+    )
+    p.add_argument("--instr", type=lambda s: int(s, 8), help="octal instruction word")
+    p.add_argument("--write", metavar="LO-HI", help="octal memory addresses written")
+    p.add_argument("-n", "--limit", type=int, default=0, help="stop after this many records")
+    p.set_defaults(func=show)
+    p = sub.add_parser("diff", help="compare two traces record by record")
+    p.add_argument("trace1")
+    p.add_argument("trace2")
+    p.add_argument("-n", "--limit", type=int, default=1, help="differences to report")
+    p.set_defaults(func=diff)
+    args = parser.parse_args()
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        exit(e)
+
+
+try:
+    if __name__ == "__main__":
+        exit(main())
+except BrokenPipeError:
+    pass